@@ -1,7 +1,11 @@
+import functools
+import mmap
+import os
 import socket
 import sys
 import time
-import select
+import struct
+import selectors
 
 # -----------------------------------------------------------------------------
 # Configuration
@@ -13,132 +17,151 @@ SEQ_ID_SIZE = 4
 MESSAGE_SIZE = PACKET_SIZE - SEQ_ID_SIZE
 FILE_PATH = "2024_congestion_control_ecs152a/docker/file.mp3"
 WINDOW_SIZE = 100 
-TIMEOUT = 0.5 
+TIMEOUT_NS = 500_000_000     # 0.5 s
+SOCKET_BUFFER_SIZE = 4 * 1024 * 1024
+
+# Receive buffer reused for every incoming ACK (seq id + short payload)
+ACK_BUF = bytearray(16)
+
+# Pre-compiled codec for the 4-byte big-endian signed sequence ID header
+SEQ_ID_STRUCT = struct.Struct('>i')
 
 # -----------------------------------------------------------------------------
 # Helper Functions
 # -----------------------------------------------------------------------------
 def read_file_data(file_path):
     """
-    Reads the file at file_path and parses it into chunks of MESSAGE_SIZE.
-    Returns a list of binary chunks.
+    Memory-maps the file at file_path and parses it into chunks of MESSAGE_SIZE.
+    Returns a list of memoryview chunks over the mapping (no per-chunk copies).
     """
-    chunks = []
     try:
         with open(file_path, 'rb') as f:
-            while True:
-                chunk = f.read(MESSAGE_SIZE)
-                if not chunk:
-                    break
-                chunks.append(chunk)
+            # An empty file can't be mapped, and has no chunks anyway
+            if os.fstat(f.fileno()).st_size == 0:
+                return []
+            # The mapping stays valid after the file itself is closed
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
     except FileNotFoundError:
         print(f"Error: File not found at {file_path}")
         sys.exit(1)
-    return chunks
+    
+    view = memoryview(mm)
+    return [view[start:start + MESSAGE_SIZE] for start in range(0, len(mm), MESSAGE_SIZE)]
 
 def create_packet(seq_id, data):
     """
     Creates a packet with the 4-byte big-endian sequence ID prepended to data.
     """
     # Convert sequence_id to 4 bytes, big-endian order
-    seq_bytes = seq_id.to_bytes(SEQ_ID_SIZE, byteorder='big', signed=True)
+    seq_bytes = SEQ_ID_STRUCT.pack(seq_id)
     
     # Concatenate the sequence bytes with the actual data payload
     return seq_bytes + data
 
-def send_chunk(sock, addr, seq_id, chunk):
+def send_packet(send, pkt):
     """
-    Sends a specific data chunk with its sequence ID to the address.
+    Sends pkt with the connected socket's bound send method.
+    A connected UDP socket reports an earlier ICMP port-unreachable (e.g. the
+    receiver is not up yet) as ConnectionRefusedError on the next send; that
+    is just a lost packet, which the timeout logic resends, so it is ignored.
     """
-    pkt = create_packet(seq_id, chunk)
-    sock.sendto(pkt, addr)
+    try:
+        send(pkt)
+    except ConnectionRefusedError:
+        pass
 
-def receive_acks(sock, base_idx, seq_ids, acked, packet_ack_times, total_chunks):
+def receive_acks(sock, sel, base_idx, acked, ack_times, total_chunks):
     """
-    Unpacks arriving ACKs from the socket and advances the window base.
+    Drains all arriving ACKs from the socket and advances the window base.
     
     Args:
         sock: The UDP socket.
+        sel: Selector the socket is registered with for reading.
         base_idx: Current window base index.
-        seq_ids: List of all sequence numbers.
-        acked: Dictionary mapping seq_id to boolean ack status.
-        packet_ack_times: Dictionary to record ACK arrival times.
+        acked: Bytearray of per-packet ack flags, indexed by packet index.
+        ack_times: List of ACK arrival times, indexed by packet index.
         total_chunks: Total number of chunks to send.
         
     Returns:
         The updated base_idx.
     """
-    # Use select for non-blocking check
-    ready = select.select([sock], [], [], 0.01)
-    if ready[0]:
-        try:
-            data, _ = sock.recvfrom(1024)
-            if len(data) >= SEQ_ID_SIZE:
+    # Use the selector for a short non-blocking check
+    if sel.select(timeout=0.01):
+        # One timestamp for the whole batch of ACKs drained below
+        now = time.monotonic_ns()
+        
+        # Per-ACK names bound to locals to skip global/attribute lookups
+        recv_into = sock.recv_into
+        unpack_ack = SEQ_ID_STRUCT.unpack_from
+        ack_buf = ACK_BUF
+        message_size = MESSAGE_SIZE
+        
+        # Keep reading until the socket has no more ACKs queued. ACKs are
+        # cumulative, so only the highest one in the batch matters and the
+        # per-ACK work is just the receive, the decode and one comparison.
+        highest_ack = 0
+        while True:
+            try:
+                nbytes = recv_into(ack_buf, 16)
+            except (BlockingIOError, ConnectionRefusedError):
+                # No more ACKs queued, or an ICMP port-unreachable surfaced on the
+                # connected socket (receiver not up yet), which is just loss
+                break
+            
+            if nbytes >= SEQ_ID_SIZE:
                 # Extract the first 4 bytes as the ACK sequence number
-                ack_seq_bytes = data[:SEQ_ID_SIZE]
-                ack_seq = int.from_bytes(ack_seq_bytes, byteorder='big', signed=True)
-                
-                now = time.time()
-                
-                # Check which packets are covered by this Cumulative ACK
-                # We iterate from current base forward
-                while base_idx < total_chunks:
-                    current_seq = seq_ids[base_idx]
-                    
-                    # If current sequence is strictly less than ACK, it's acknowledged
-                    # This relies on the Cumulative ACK property:
-                    # An ACK of 'N' implies all bytes < N have been received.
-                    if current_seq < ack_seq:
-                        if not acked[current_seq]:
-                            acked[current_seq] = True
-                            packet_ack_times[current_seq] = now
-                        base_idx += 1
-                    else:
-                        break
-        except BlockingIOError:
-            pass
+                ack_seq = unpack_ack(ack_buf)[0]
+                if ack_seq > highest_ack:
+                    highest_ack = ack_seq
+        
+        # Index of the first packet NOT covered by the Cumulative ACK.
+        # An ACK of 'N' implies all bytes < N have been received, so every
+        # packet starting below N is acknowledged (rounded up so the last,
+        # possibly short, chunk is covered too).
+        ack_idx = min(-(-highest_ack // message_size), total_chunks)
+        if ack_idx > base_idx:
+            # Mark the whole newly-acked range with slice assignments
+            newly_acked = ack_idx - base_idx
+            acked[base_idx:ack_idx] = b'\x01' * newly_acked
+            ack_times[base_idx:ack_idx] = [now] * newly_acked
+            base_idx = ack_idx
             
     return base_idx
 
-def handle_timeout(sock, addr, base_idx, seq_ids, packets_data, packet_last_sent_times):
+def handle_timeout(send, base_idx, packets, last_sent, now):
     """
-    Checks if the oldest un-ACKed packet (at base_idx) has timed out. 
-    If so, retransmits it.
+    Checks if the oldest un-ACKed packet (at base_idx) has timed out as of
+    time 'now'. If so, retransmits it.
     """
-    base_seq = seq_ids[base_idx]
-    
-    # Only check if we have sent it at least once
-    if base_seq in packet_last_sent_times:
+    # Only check if we have sent it at least once (0 means never sent)
+    if last_sent[base_idx]:
         # Calculate time elapsed since the last time we sent this packet
-        time_since_last_send = time.time() - packet_last_sent_times[base_seq]
+        time_since_last_send = now - last_sent[base_idx]
         
-        if time_since_last_send > TIMEOUT:
+        if time_since_last_send > TIMEOUT_NS:
             # Retransmit the base packet
             # Since the receiver buffers out-of-order packets, simply retransmitting
             # the oldest missing packet (Selective Retransmit of the base) is sufficient
             # to plug the hole and allow the Cumulative ACK to jump forward.
-            packet_last_sent_times[base_seq] = time.time()
-            send_chunk(sock, addr, base_seq, packets_data[base_seq])
+            last_sent[base_idx] = now
+            send(packets[base_idx])
 
-def calculate_metrics(start_time, end_time, total_data_size, seq_ids, packet_send_times, packet_ack_times):
+def calculate_metrics(start_time, end_time, total_data_size, acked, send_times, ack_times):
     """
     Calculates and prints the required metrics: Throughput, Avg Delay, Performance.
     """
     # Throughput calculation
-    duration = end_time - start_time
+    # Timestamps are integer nanoseconds; convert to seconds here
+    duration = (end_time - start_time) / 1e9
     throughput = total_data_size / duration if duration > 0 else 0
     
     # Average Delay calculation
-    total_delay = 0
-    total_samples = 0
-    for seq in seq_ids:
-        if seq in packet_ack_times and seq in packet_send_times:
-            # Delay = Time ACK Received - Time FIRST Sent
-            delay = packet_ack_times[seq] - packet_send_times[seq]
-            total_delay += delay
-            total_samples += 1
+    # Delay = Time ACK Received - Time FIRST Sent, over every acked packet.
+    # Single pass over the parallel arrays; ack flags are 0/1 so they sum to a count.
+    total_delay = sum(ack - sent for ack, sent, ok in zip(ack_times, send_times, acked) if ok)
+    total_samples = sum(acked)
             
-    avg_delay = total_delay / total_samples if total_samples > 0 else 0
+    avg_delay = (total_delay / total_samples) / 1e9 if total_samples > 0 else 0
     
     # Performance metric calculation
     # Metric = 0.3 * (Throughput/1000) + 0.7 / AvgDelay
@@ -161,29 +184,48 @@ def main():
     total_chunks = len(chunks)
     total_data_size = sum(len(c) for c in chunks)
     
-    packets_data = {}
-    for i, chunk in enumerate(chunks):
-        seq_id = i * MESSAGE_SIZE
-        packets_data[seq_id] = chunk
-        
-    seq_ids = sorted(packets_data.keys())
-    acked = {seq: False for seq in seq_ids}
+    # Build every packet once up front so (re)transmissions just reuse the bytes
+    packets = [create_packet(i * MESSAGE_SIZE, chunk) for i, chunk in enumerate(chunks)]
     
-    # Time Tracking
-    packet_send_times = {}       # First send time per packet
-    packet_last_sent_times = {}  # Last send time per packet (for re-transmit)
-    packet_ack_times = {}        # Ack arrival time per packet
+    # Per-packet state, indexed by packet index (0 means "not yet")
+    acked = bytearray(total_chunks)   # 1 once the packet is cumulatively ACKed
+    send_times = [0] * total_chunks   # First send time per packet
+    last_sent = [0] * total_chunks    # Last send time per packet (for re-transmit)
+    ack_times = [0] * total_chunks    # Ack arrival time per packet
     
     # Setup Socket
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     sock.setblocking(False)
+    
+    # The default kernel buffers are easily starved by a full window of
+    # back-to-back packets (and the burst of ACKs coming back), so enlarge them
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_BUFFER_SIZE)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER_SIZE)
+    
     server_addr = (RECEIVER_IP, RECEIVER_PORT)
+    
+    # UDP connect just pins the destination (no handshake), so every send
+    # below can use send() without passing and checking an address each time
+    sock.connect(server_addr)
+
+    # Register the socket once with a persistent selector (epoll on Linux)
+    sel = selectors.DefaultSelector()
+    sel.register(sock, selectors.EVENT_READ)
+    
+    # Bind the names used on every iteration to locals, so the hot loop does
+    # fast local loads instead of global and attribute lookups
+    clock = time.monotonic_ns
+    send = functools.partial(send_packet, sock.send)
+    window_size = WINDOW_SIZE
         
     # Start Timer
-    start_time = time.time()
+    start_time = time.monotonic_ns()
     
     # Transmission Loop
     while base_idx < total_chunks:
+        # Sample the clock once per iteration; a burst of sends takes far
+        # less time than the timer resolution we care about.
+        loop_now = clock()
         
         # ---------------------------------------------------------------------
         # 1. Window Filling
@@ -192,48 +234,57 @@ def main():
 
         # Current Window Range = [base_idx, base_idx + WINDOW_SIZE)
         # Packet index cannot exceed this range.
-        while next_seq_idx < base_idx + WINDOW_SIZE and next_seq_idx < total_chunks:
-            seq_to_send = seq_ids[next_seq_idx]
-            current_time = time.time()
-            
-            # Record first send time
-            if seq_to_send not in packet_send_times:
-                packet_send_times[seq_to_send] = current_time
-            
-            # Record last send time
-            packet_last_sent_times[seq_to_send] = current_time
+        window_end = min(base_idx + window_size, total_chunks)
+        if next_seq_idx < window_end:
+            # Send the newly opened part of the window as one burst
+            for pkt in packets[next_seq_idx:window_end]:
+                send(pkt)
             
-            # Send Packet
-            send_chunk(sock, server_addr, seq_to_send, packets_data[seq_to_send])
-            next_seq_idx += 1
+            # Record first and last send time. next_seq_idx only moves forward, so
+            # these are always first sends (retransmits never go through here).
+            burst_times = [loop_now] * (window_end - next_seq_idx)
+            send_times[next_seq_idx:window_end] = burst_times
+            last_sent[next_seq_idx:window_end] = burst_times
+            next_seq_idx = window_end
 
         # ---------------------------------------------------------------------
         # 2. ACK Handling
         #    Check for incoming ACKs and move base.
         # ---------------------------------------------------------------------
-        new_base_idx = receive_acks(sock, base_idx, seq_ids, acked, packet_ack_times, total_chunks)
+        new_base_idx = receive_acks(sock, sel, base_idx, acked, ack_times, total_chunks)
         base_idx = new_base_idx
         
+        # Waiting for ACKs may have blocked, so refresh the clock
+        loop_now = clock()
+        
         # ---------------------------------------------------------------------
         # 3. Timeout Handling
         #    Retransmit base if needed.
         # ---------------------------------------------------------------------
         if base_idx < total_chunks:
-            handle_timeout(sock, server_addr, base_idx, seq_ids, packets_data, packet_last_sent_times)
+            handle_timeout(send, base_idx, packets, last_sent, loop_now)
 
     # Transmission completed
-    end_time = time.time()
+    end_time = time.monotonic_ns()
     
     # Send FINACK multiple times to ensure termination
-    fin_packet = create_packet(seq_ids[-1] + MESSAGE_SIZE, b'==FINACK==')
+    fin_packet = create_packet(total_chunks * MESSAGE_SIZE, b'==FINACK==')
+    # Send them back-to-back, then linger briefly so they leave the socket
+    # buffer before it is closed
     for _ in range(5):
-        sock.sendto(fin_packet, server_addr)
-        time.sleep(0.1)
+        try:
+            sock.send(fin_packet)
+        except ConnectionRefusedError:
+            # The connected socket reports the receiver's port as closed once it
+            # has taken a FINACK and shut down, so there is nobody left to tell
+            break
+    time.sleep(0.05)
         
+    sel.close()
     sock.close()
     
     # Create output metrics
-    calculate_metrics(start_time, end_time, total_data_size, seq_ids, packet_send_times, packet_ack_times)
+    calculate_metrics(start_time, end_time, total_data_size, acked, send_times, ack_times)
 
 if __name__ == "__main__":
     main()
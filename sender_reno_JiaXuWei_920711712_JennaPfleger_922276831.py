@@ -1,7 +1,12 @@
+import math
+import functools
+import mmap
+import os
 import socket
 import sys
 import time
-import select
+import struct
+import selectors
 
 # -----------------------------------------------------------------------------
 # Configuration
@@ -12,7 +17,15 @@ PACKET_SIZE = 1024
 SEQ_ID_SIZE = 4
 MESSAGE_SIZE = PACKET_SIZE - SEQ_ID_SIZE
 FILE_PATH = "2024_congestion_control_ecs152a/docker/file.mp3"
-TIMEOUT = 0.5 
+TIMEOUT_NS = 500_000_000     # 0.5 s
+MAX_ACK_WAIT_NS = 50_000_000  # Upper bound on a single blocking wait for ACKs
+SOCKET_BUFFER_SIZE = 4 * 1024 * 1024
+
+# Receive buffer reused for every incoming ACK (seq id + short payload)
+ACK_BUF = bytearray(16)
+
+# Pre-compiled codec for the 4-byte big-endian signed sequence ID header
+SEQ_ID_STRUCT = struct.Struct('>i')
 
 # TCP Reno Specifics
 INIT_CWND = 1.0       # Initial Congestion Window
@@ -23,56 +36,77 @@ INIT_SSTHRESH = 64    # Initial Slow Start Threshold
 # -----------------------------------------------------------------------------
 def read_file_data(file_path):
     """
-    Reads the file at file_path and parses it into chunks of MESSAGE_SIZE.
-    Returns a list of binary chunks.
+    Memory-maps the file at file_path and parses it into chunks of MESSAGE_SIZE.
+    Returns a list of memoryview chunks over the mapping (no per-chunk copies).
     """
-    chunks = []
     try:
         with open(file_path, 'rb') as f:
-            while True:
-                chunk = f.read(MESSAGE_SIZE)
-                if not chunk:
-                    break
-                chunks.append(chunk)
+            # An empty file can't be mapped, and has no chunks anyway
+            if os.fstat(f.fileno()).st_size == 0:
+                return []
+            # The mapping stays valid after the file itself is closed
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
     except FileNotFoundError:
         print(f"Error: File not found at {file_path}")
         sys.exit(1)
-    return chunks
+    
+    view = memoryview(mm)
+    return [view[start:start + MESSAGE_SIZE] for start in range(0, len(mm), MESSAGE_SIZE)]
 
 def create_packet(seq_id, data):
     """
     Creates a packet with the 4-byte big-endian sequence ID prepended to data.
     """
     # Convert sequence_id to 4 bytes, big-endian order
-    seq_bytes = seq_id.to_bytes(SEQ_ID_SIZE, byteorder='big', signed=True)
+    seq_bytes = SEQ_ID_STRUCT.pack(seq_id)
     return seq_bytes + data
 
-def send_chunk(sock, addr, seq_id, chunk):
+def send_packet(send, pkt):
     """
-    Sends a specific data chunk with its sequence ID to the address.
+    Sends pkt with the connected socket's bound send method.
+    A connected UDP socket reports an earlier ICMP port-unreachable (e.g. the
+    receiver is not up yet) as ConnectionRefusedError on the next send; that
+    is just a lost packet, which the timeout logic resends, so it is ignored.
     """
-    pkt = create_packet(seq_id, chunk)
-    sock.sendto(pkt, addr)
+    try:
+        send(pkt)
+    except ConnectionRefusedError:
+        pass
 
-def calculate_metrics(start_time, end_time, total_data_size, seq_ids, packet_send_times, packet_ack_times):
+def send_new_packets(send, packets, next_seq_idx, window_end, send_times, last_sent, now):
+    """
+    Sends the not-yet-sent packets in [next_seq_idx, window_end) as one burst
+    and records their send times. Returns the new next_seq_idx.
+    """
+    if next_seq_idx >= window_end:
+        return next_seq_idx
+    
+    for pkt in packets[next_seq_idx:window_end]:
+        send(pkt)
+    
+    # Record first and last send time. next_seq_idx only moves forward, so
+    # these are always first sends (retransmits never go through here).
+    burst_times = [now] * (window_end - next_seq_idx)
+    send_times[next_seq_idx:window_end] = burst_times
+    last_sent[next_seq_idx:window_end] = burst_times
+    return window_end
+
+def calculate_metrics(start_time, end_time, total_data_size, acked, send_times, ack_times):
     """
     Calculates and prints the required metrics: Throughput, Avg Delay, Performance.
     """
     # Throughput calculation
-    duration = end_time - start_time
+    # Timestamps are integer nanoseconds; convert to seconds here
+    duration = (end_time - start_time) / 1e9
     throughput = total_data_size / duration if duration > 0 else 0
     
     # Average Delay calculation
-    total_delay = 0
-    total_samples = 0
-    for seq in seq_ids:
-        if seq in packet_ack_times and seq in packet_send_times:
-            # Delay = Time ACK Received - Time FIRST Sent
-            delay = packet_ack_times[seq] - packet_send_times[seq]
-            total_delay += delay
-            total_samples += 1
+    # Delay = Time ACK Received - Time FIRST Sent, over every acked packet.
+    # Single pass over the parallel arrays; ack flags are 0/1 so they sum to a count.
+    total_delay = sum(ack - sent for ack, sent, ok in zip(ack_times, send_times, acked) if ok)
+    total_samples = sum(acked)
             
-    avg_delay = total_delay / total_samples if total_samples > 0 else 0
+    avg_delay = (total_delay / total_samples) / 1e9 if total_samples > 0 else 0
     
     # Performance metric calculation
     # Metric = 0.3 * (Throughput/1000) + 0.7 / AvgDelay
@@ -114,10 +148,10 @@ class RenoState:
             # This means the window grows by 1 Packet per Round Trip Time (RTT). (Linear))
             self.cwnd += 1.0 / self.cwnd
 
-    def on_dup_ack(self, sock, addr, missing_seq, packets_data, packet_last_sent_times):
+    def on_dup_ack(self):
         """
-        Called when a duplicate ACK arrives.
-        Returns True if a packet was retransmitted.
+        Called when a duplicate ACK for the base packet arrives.
+        Returns True if the base packet should be fast-retransmitted now.
         """
         self.dup_acks += 1
         
@@ -135,13 +169,11 @@ class RenoState:
             self.in_fast_recovery = True
             
             # Retransmit the missing segment immediately
-            if missing_seq in packets_data:
-                packet_last_sent_times[missing_seq] = time.time()
-                send_chunk(sock, addr, missing_seq, packets_data[missing_seq])
-                return True
+            return True
         elif self.dup_acks > 3:
             # Fast Recovery: Inflate window for each additional dup ACK
-            # This allows us to send new data if the window allows
+            # Each extra dup ACK means a packet has left the network, so the
+            # caller can send new data right away if the inflated window allows
             self.cwnd += 1
             
         return False
@@ -175,103 +207,128 @@ def main():
     total_chunks = len(chunks)
     total_data_size = sum(len(c) for c in chunks)
     
-    packets_data = {}
-    for i, chunk in enumerate(chunks):
-        seq_id = i * MESSAGE_SIZE
-        packets_data[seq_id] = chunk
-        
-    seq_ids = sorted(packets_data.keys())
-    acked = {seq: False for seq in seq_ids}
+    # Build every packet once up front so (re)transmissions just reuse the bytes
+    packets = [create_packet(i * MESSAGE_SIZE, chunk) for i, chunk in enumerate(chunks)]
     
-    # Time Tracking
-    packet_send_times = {}       # First send time per packet
-    packet_last_sent_times = {}  # Last send time per packet (for re-transmit)
-    packet_ack_times = {}        # Ack arrival time per packet
+    # Per-packet state, indexed by packet index (0 means "not yet")
+    acked = bytearray(total_chunks)   # 1 once the packet is cumulatively ACKed
+    send_times = [0] * total_chunks   # First send time per packet
+    last_sent = [0] * total_chunks    # Last send time per packet (for re-transmit)
+    ack_times = [0] * total_chunks    # Ack arrival time per packet
     
     # Setup Socket
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     sock.setblocking(False)
+    
+    # The default kernel buffers are easily starved by a full window of
+    # back-to-back packets (and the burst of ACKs coming back), so enlarge them
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_BUFFER_SIZE)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER_SIZE)
+    
     server_addr = (RECEIVER_IP, RECEIVER_PORT)
+    
+    # UDP connect just pins the destination (no handshake), so every send
+    # below can use send() without passing and checking an address each time
+    sock.connect(server_addr)
+
+    # Register the socket once with a persistent selector (epoll on Linux)
+    sel = selectors.DefaultSelector()
+    sel.register(sock, selectors.EVENT_READ)
+    
+    # Bind the names used on every iteration (and every ACK) to locals, so the
+    # hot loop does fast local loads instead of global and attribute lookups
+    clock = time.monotonic_ns
+    send = functools.partial(send_packet, sock.send)
+    recv_into = sock.recv_into
+    unpack_ack = SEQ_ID_STRUCT.unpack_from
+    ack_buf = ACK_BUF
+    message_size = MESSAGE_SIZE
+    timeout_ns = TIMEOUT_NS
+    max_ack_wait_ns = MAX_ACK_WAIT_NS
         
-    start_time = time.time()
+    start_time = time.monotonic_ns()
     
     while base_idx < total_chunks:
+        # Sample the clock once per iteration; a burst of sends takes far
+        # less time than the timer resolution we care about.
+        loop_now = clock()
         
         # ---------------------------------------------------------------------
         # 1. Transmission Phase
         #    Send packets while the number of in-flight packets is within cwnd.
         # ---------------------------------------------------------------------
-        while next_seq_idx < total_chunks:
-            # Calculate packets currently in flight
-            # In-flight = (next_seq_idx - base_idx)
-            # This represents the number of unacknowledged packets currently in the network.
-            # We must checks strict inequality against cwnd (Congestion Window).
-            # If flight size < cwnd, we are allowed to inject more packets.
-            if (next_seq_idx - base_idx) < reno.cwnd:
-                seq_to_send = seq_ids[next_seq_idx]
-                current_time = time.time()
-                
-                # Record first send time
-                if seq_to_send not in packet_send_times:
-                    packet_send_times[seq_to_send] = current_time
-                
-                # Record last send time
-                packet_last_sent_times[seq_to_send] = current_time
-                
-                send_chunk(sock, server_addr, seq_to_send, packets_data[seq_to_send])
-                next_seq_idx += 1
-            else:
-                # Window is full
-                break
+        # Calculate packets currently in flight
+        # In-flight = (next_seq_idx - base_idx)
+        # This represents the number of unacknowledged packets currently in the network.
+        # We must checks strict inequality against cwnd (Congestion Window).
+        # If flight size < cwnd, we are allowed to inject more packets, so the
+        # window ends at base_idx + ceil(cwnd).
+        window_end = min(base_idx + math.ceil(reno.cwnd), total_chunks)
+        next_seq_idx = send_new_packets(send, packets, next_seq_idx, window_end,
+                                        send_times, last_sent, loop_now)
 
         # ---------------------------------------------------------------------
         # 2. Acknowledgement Phase
         #    Process all available ACKs to update state and drain buffer.
         # ---------------------------------------------------------------------
-        ready = select.select([sock], [], [], 0.01)
-        if ready[0]:
+
+        # The transmission phase only stops once the window is full (or every
+        # packet is out), so there is nothing to do until an ACK arrives or the
+        # base packet's retransmission deadline passes. Block on whichever comes
+        # first instead of waking up on a fixed tick.
+        wait_ns = timeout_ns - (loop_now - last_sent[base_idx])
+        wait_ns = min(max(wait_ns, 0), max_ack_wait_ns)
+        ready = sel.select(timeout=wait_ns / 1e9)
+        
+        # The wait may have blocked, so refresh the clock. This single sample
+        # also timestamps the whole batch of ACKs drained below.
+        loop_now = clock()
+        if ready:
             try:
                 # Process all available ACKs to drain the buffer and update window quickly
                 while True:
                     try:
-                        data, _ = sock.recvfrom(1024)
-                        if len(data) >= SEQ_ID_SIZE:
-                            ack_seq_bytes = data[:SEQ_ID_SIZE]
-                            ack_seq = int.from_bytes(ack_seq_bytes, byteorder='big', signed=True)
+                        nbytes = recv_into(ack_buf, 16)
+                        if nbytes >= SEQ_ID_SIZE:
+                            ack_seq = unpack_ack(ack_buf)[0]
                             
-                            now = time.time()
-                            base_seq = seq_ids[base_idx] if base_idx < total_chunks else float('inf')
+                            # Index of the first packet NOT covered by this ACK
+                            # (rounded up so the last, possibly short, chunk is covered too)
+                            ack_idx = -(-ack_seq // message_size)
                             
-                            # Analyze ACK
-                            # If ack_seq > base_seq, it acked something new
-                            if ack_seq > base_seq:
+                            # Analyze ACK by comparing its packet index against the base
+                            if ack_idx > base_idx:
                                 # Standard New ACK
                                 # It Cumulative ACKs everything before ack_seq.
                                 # Because of Cumulative ACK, receiving ack_seq means ALL packets
                                 # with sequence sequence numbers < ack_seq have been safely received.
-                                
-                                # Advance base_idx
-                                old_base_idx = base_idx
-                                while base_idx < total_chunks and seq_ids[base_idx] < ack_seq:
-                                    scurrent = seq_ids[base_idx]
-                                    if not acked[scurrent]:
-                                        acked[scurrent] = True
-                                        packet_ack_times[scurrent] = now
-                                    base_idx += 1
-                                
-                                # If we advanced, it's a "New ACK"
-                                if base_idx > old_base_idx:
-                                    reno.on_new_ack()
+                                ack_idx = min(ack_idx, total_chunks)
+                                newly_acked = ack_idx - base_idx
+                                acked[base_idx:ack_idx] = b'\x01' * newly_acked
+                                ack_times[base_idx:ack_idx] = [loop_now] * newly_acked
+                                base_idx = ack_idx
+                                reno.on_new_ack()
 
-                            elif ack_seq == base_seq:
-                                # Duplicate ACK: Receiver is still waiting for base_seq.
-                                # Since ack_seq == base_seq, this confirms the receiver has not yet received base_seq.
+                            elif ack_idx == base_idx and base_idx < total_chunks:
+                                # Duplicate ACK: Receiver is still waiting for the base packet.
+                                # This confirms the receiver has not yet received it.
                                 # Receiving 3 of these triggers Fast Retransmit.
-                                reno.on_dup_ack(sock, server_addr, base_seq, packets_data, packet_last_sent_times)
+                                if reno.on_dup_ack():
+                                    last_sent[base_idx] = loop_now
+                                    send(packets[base_idx])
+                                
+                                # In Fast Recovery every dup ACK inflates cwnd, so send
+                                # whatever new data the inflated window now allows
+                                if reno.in_fast_recovery:
+                                    window_end = min(base_idx + math.ceil(reno.cwnd), total_chunks)
+                                    next_seq_idx = send_new_packets(send, packets, next_seq_idx, window_end,
+                                                                    send_times, last_sent, loop_now)
 
-                            # If ack_seq < base_seq, it's an old ACK, ignore.
+                            # If ack_idx < base_idx, it's an old ACK, ignore.
                             
-                    except BlockingIOError:
+                    except (BlockingIOError, ConnectionRefusedError):
+                        # No more ACKs queued, or an ICMP port-unreachable surfaced on the
+                        # connected socket (receiver not up yet), which is just loss
                         break
             except Exception:
                 pass
@@ -281,39 +338,43 @@ def main():
         #    Retransmit the base packet if the timeout interval has passed.
         # ---------------------------------------------------------------------
         if base_idx < total_chunks:
-            base_seq = seq_ids[base_idx]
-            if base_seq in packet_last_sent_times:
-                time_since_last_send = time.time() - packet_last_sent_times[base_seq]
-                if time_since_last_send > TIMEOUT:
+            if last_sent[base_idx]:
+                time_since_last_send = loop_now - last_sent[base_idx]
+                if time_since_last_send > timeout_ns:
                     # Timeout occurred
                     # This implies severe congestion or loss.
                     reno.on_timeout()
                     
                     # Retransmit base packet
-                    # Note: We only retransmit the oldest unacknowledged packet (base_seq).
+                    # Note: We only retransmit the oldest unacknowledged packet (base_idx).
                     # This relies on the receiver's buffering capability to fill the hole.
-                    packet_last_sent_times[base_seq] = time.time()
-                    send_chunk(sock, server_addr, base_seq, packets_data[base_seq])
+                    last_sent[base_idx] = loop_now
+                    send(packets[base_idx])
                     
                     # Reset ssthresh and cwnd is handled in on_timeout.
                     pass
 
     # Transmission completed
-    end_time = time.time()
+    end_time = time.monotonic_ns()
     
     # Send FINACK multiple times
-    if seq_ids:
-        fin_packet = create_packet(seq_ids[-1] + MESSAGE_SIZE, b'==FINACK==')
-    else:
-        fin_packet = create_packet(0, b'==FINACK==')
-        
+    fin_packet = create_packet(total_chunks * MESSAGE_SIZE, b'==FINACK==')
+
+    # Send them back-to-back, then linger briefly so they leave the socket
+    # buffer before it is closed
     for _ in range(5):
-        sock.sendto(fin_packet, server_addr)
-        time.sleep(0.1)
+        try:
+            sock.send(fin_packet)
+        except ConnectionRefusedError:
+            # The connected socket reports the receiver's port as closed once it
+            # has taken a FINACK and shut down, so there is nobody left to tell
+            break
+    time.sleep(0.05)
         
+    sel.close()
     sock.close()
     
-    calculate_metrics(start_time, end_time, total_data_size, seq_ids, packet_send_times, packet_ack_times)
+    calculate_metrics(start_time, end_time, total_data_size, acked, send_times, ack_times)
 
 if __name__ == "__main__":
     main()
@@ -1,9 +1,11 @@
+import functools
+import mmap
 import socket
 import sys
 import time
 import os
 import struct
-import select
+import selectors
 
 # -----------------------------------------------------------------------------
 # Configuration
@@ -14,63 +16,72 @@ PACKET_SIZE = 1024
 SEQ_ID_SIZE = 4
 MESSAGE_SIZE = PACKET_SIZE - SEQ_ID_SIZE
 FILE_PATH = "2024_congestion_control_ecs152a/docker/file.mp3" 
-TIMEOUT = 1.0 
+TIMEOUT_NS = 1_000_000_000   # 1.0 s
+
+# Receive buffer reused for every incoming ACK (seq id + short payload)
+ACK_BUF = bytearray(16)
+
+# Pre-compiled codec for the 4-byte big-endian signed sequence ID header
+SEQ_ID_STRUCT = struct.Struct('>i')
 
 # -----------------------------------------------------------------------------
 # Helper Functions
 # -----------------------------------------------------------------------------
 def read_file_data(file_path):
     """
-    Reads the file at file_path and parses it into chunks of MESSAGE_SIZE.
-    Returns a list of binary chunks.
+    Memory-maps the file at file_path and parses it into chunks of MESSAGE_SIZE.
+    Returns a list of memoryview chunks over the mapping (no per-chunk copies).
     """
-    chunks = []
     try:
         with open(file_path, 'rb') as f:
-            while True:
-                chunk = f.read(MESSAGE_SIZE)
-                if not chunk:
-                    break
-                chunks.append(chunk)
+            # An empty file can't be mapped, and has no chunks anyway
+            if os.fstat(f.fileno()).st_size == 0:
+                return []
+            # The mapping stays valid after the file itself is closed
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
     except FileNotFoundError:
         print(f"Error: File not found at {file_path}")
         sys.exit(1)
-    return chunks
+    
+    view = memoryview(mm)
+    return [view[start:start + MESSAGE_SIZE] for start in range(0, len(mm), MESSAGE_SIZE)]
 
 def create_packet(seq_id, data):
     """
     Creates a packet with the 4-byte big-endian sequence ID prepended to data.
     """
     # Convert sequence_id to 4 bytes, big-endian order
-    seq_bytes = seq_id.to_bytes(SEQ_ID_SIZE, byteorder='big', signed=True)
+    seq_bytes = SEQ_ID_STRUCT.pack(seq_id)
     return seq_bytes + data
 
-def send_chunk(sock, addr, seq_id, chunk):
+def send_packet(send, pkt):
     """
-    Sends a specific data chunk with its sequence ID to the address.
+    Sends pkt with the connected socket's bound send method.
+    A connected UDP socket reports an earlier ICMP port-unreachable (e.g. the
+    receiver is not up yet) as ConnectionRefusedError on the next send; that
+    is just a lost packet, which the timeout logic resends, so it is ignored.
     """
-    pkt = create_packet(seq_id, chunk)
-    sock.sendto(pkt, addr)
+    try:
+        send(pkt)
+    except ConnectionRefusedError:
+        pass
 
-def calculate_metrics(start_time, end_time, total_data_size, seq_ids, packet_send_times, packet_ack_times):
+def calculate_metrics(start_time, end_time, total_data_size, acked, send_times, ack_times):
     """
     Calculates and prints the required metrics: Throughput, Avg Delay, Performance.
     """
     # Throughput calculation
-    duration = end_time - start_time
+    # Timestamps are integer nanoseconds; convert to seconds here
+    duration = (end_time - start_time) / 1e9
     throughput = total_data_size / duration if duration > 0 else 0
     
     # Average Delay calculation
-    total_delay = 0
-    total_samples = 0
-    for seq in seq_ids:
-        if seq in packet_ack_times and seq in packet_send_times:
-            # Delay = Time ACK Received - Time FIRST Sent
-            delay = packet_ack_times[seq] - packet_send_times[seq]
-            total_delay += delay
-            total_samples += 1
+    # Delay = Time ACK Received - Time FIRST Sent, over every acked packet.
+    # Single pass over the parallel arrays; ack flags are 0/1 so they sum to a count.
+    total_delay = sum(ack - sent for ack, sent, ok in zip(ack_times, send_times, acked) if ok)
+    total_samples = sum(acked)
             
-    avg_delay = total_delay / total_samples if total_samples > 0 else 0
+    avg_delay = (total_delay / total_samples) / 1e9 if total_samples > 0 else 0
     
     # Performance metric calculation
     # Metric = 0.3 * (Throughput/1000) + 0.7 / AvgDelay
@@ -89,67 +100,100 @@ def main():
     total_chunks = len(chunks)
     total_data_size = sum(len(c) for c in chunks)
 
-    seq_ids = range(total_chunks)
+    # Build every packet once up front so (re)transmissions just reuse the bytes
+    packets = [create_packet(i * MESSAGE_SIZE, chunk) for i, chunk in enumerate(chunks)]
 
-    packet_send_times = {}
-    packet_last_sent_times = {}
-    packet_ack_times = {}
+    # Per-packet state, indexed by packet index (0 means "not yet")
+    acked = bytearray(total_chunks)
+    send_times = [0] * total_chunks
+    last_sent = [0] * total_chunks
+    ack_times = [0] * total_chunks
 
     server_addr = (RECEIVER_IP, RECEIVER_PORT)
     
     # Setup Socket
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     sock.settimeout(0.0)
+    
+    # UDP connect just pins the destination (no handshake), so sends and
+    # receives below don't pass or return an address each time
+    sock.connect(server_addr)
+    send = functools.partial(send_packet, sock.send)
 
-    start_time = time.time()
+    # Register the socket once with a persistent selector (epoll on Linux)
+    sel = selectors.DefaultSelector()
+    sel.register(sock, selectors.EVENT_READ)
+
+    start_time = time.monotonic_ns()
     
-    for i in seq_ids:
-        try:
-            # -----------------------------------------------------------------
-            # 1. Send Packet
-            #    Send the current packet to the receiver.
-            # -----------------------------------------------------------------
-            seq_id = i * MESSAGE_SIZE
-            send_chunk(sock, server_addr, seq_id, chunks[i])
-            packet_send_times[i] = time.time()
-            packet_last_sent_times[i] = time.time()
-
-            # -----------------------------------------------------------------
-            # 2. Wait for ACK
-            #    Wait for the ACK for the current packet.
-            # -----------------------------------------------------------------
-            while True:
-                ready = select.select([sock], [], [], TIMEOUT)
-                if ready[0]:
-                    ack, _ = sock.recvfrom(MESSAGE_SIZE)
-                    ack_seq_bytes = ack[:SEQ_ID_SIZE]
-                    ack_seq = int.from_bytes(ack_seq_bytes, byteorder='big', signed=True)
-                    packet_ack_times[i] = time.time()
-                    if ack_seq <= seq_id + MESSAGE_SIZE:
-                        packet_ack_times[i] = time.time()
-                        break
-                else:
-                    # ---------------------------------------------------------
-                    # 3. Timeout / Retransmit
-                    #    Retransmit the packet if timeout occurs.
-                    # ---------------------------------------------------------
-                    send_chunk(sock, server_addr, seq_id, chunks[i])
-                    packet_last_sent_times[i] = time.time()
-            
-        except TimeoutError:
-            print("TimeoutError")
+    for i in range(total_chunks):
+        # ---------------------------------------------------------------------
+        # 1. Send Packet
+        #    Send the current packet to the receiver.
+        # ---------------------------------------------------------------------
+        seq_id = i * MESSAGE_SIZE
+        send(packets[i])
+        send_times[i] = last_sent[i] = time.monotonic_ns()
+
+        # Absolute retransmission deadline, so ACKs that don't match this
+        # packet don't restart the timer
+        deadline = last_sent[i] + TIMEOUT_NS
+
+        # ---------------------------------------------------------------------
+        # 2. Wait for ACK
+        #    Wait for the ACK for the current packet.
+        # ---------------------------------------------------------------------
+        while True:
+            remaining = deadline - time.monotonic_ns()
+            if remaining <= 0:
+                # -------------------------------------------------------------
+                # 3. Timeout / Retransmit
+                #    Retransmit the packet if timeout occurs.
+                # -------------------------------------------------------------
+                send(packets[i])
+                last_sent[i] = time.monotonic_ns()
+                deadline = last_sent[i] + TIMEOUT_NS
+                continue
+
+            if sel.select(timeout=remaining / 1e9):
+                try:
+                    nbytes = sock.recv_into(ACK_BUF, 16)
+                except ConnectionRefusedError:
+                    # An ICMP port-unreachable, not an ACK: the packet was lost,
+                    # so keep waiting and retransmit when the deadline passes
+                    continue
 
-    end_time = time.time()
+                # Ignore runts so we never decode stale bytes left in ACK_BUF
+                if nbytes < SEQ_ID_SIZE:
+                    continue
+
+                ack_seq = SEQ_ID_STRUCT.unpack_from(ACK_BUF)[0]
+                # The cumulative ACK must move past this packet; stale ACKs for
+                # earlier packets (e.g. from a retransmission) are ignored
+                if ack_seq > seq_id:
+                    ack_times[i] = time.monotonic_ns()
+                    acked[i] = 1
+                    break
+
+    end_time = time.monotonic_ns()
     
     # Send FINACK multiple times to close connection
-    fin_packet = create_packet(seq_ids[-1] + MESSAGE_SIZE, b'==FINACK==')
+    fin_packet = create_packet(total_chunks * MESSAGE_SIZE, b'==FINACK==')
+    # Send them back-to-back, then linger briefly so they leave the socket
+    # buffer before it is closed
     for _ in range(5):
-        sock.sendto(fin_packet, server_addr)
-        time.sleep(0.2)
+        try:
+            sock.send(fin_packet)
+        except ConnectionRefusedError:
+            # The connected socket reports the receiver's port as closed once it
+            # has taken a FINACK and shut down, so there is nobody left to tell
+            break
+    time.sleep(0.05)
         
+    sel.close()
     sock.close()
     
-    calculate_metrics(start_time, end_time, total_data_size, seq_ids, packet_send_times, packet_ack_times)
+    calculate_metrics(start_time, end_time, total_data_size, acked, send_times, ack_times)
 
 if __name__ == "__main__":
     main()